@@ -4,160 +4,303 @@ Sistema Gestione Biblioteca - MongoDB Setup Script
 Esegue il setup completo del database biblioteca
 """
 
-from pymongo import MongoClient, ASCENDING, DESCENDING
-from pymongo.errors import ConnectionFailure, DuplicateKeyError
-from bson import ObjectId
+from pymongo import MongoClient, IndexModel, InsertOne, ASCENDING, DESCENDING, uri_parser
+from pymongo.errors import ConnectionFailure, CollectionInvalid, DuplicateKeyError, OperationFailure
+from bson import ObjectId, Int64
+from bson.json_util import dumps as bson_dumps, RELAXED_JSON_OPTIONS
 from datetime import datetime, timedelta
-import json
+from concurrent.futures import ThreadPoolExecutor
 import sys
+import warnings
 import os
 from typing import List, Dict, Any
 
+try:
+    import orjson
+except ImportError:
+    # orjson opzionale: senza, l'export usa bson.json_util (incluso in pymongo)
+    orjson = None
+
+# Compressione del protocollo: pymongo scarta gli algoritmi senza modulo installato
+# (zstd e snappy sono opzionali), zlib è sempre disponibile
+_COMPRESSORS = ["zstd", "snappy", "zlib"]
+
+# Opzioni client per un mongod locale single-node: ack dal solo primary, senza
+# attesa del journal, pool ridotto, timeout breve se il server non risponde
+# (la connessione è verificata dalla prima operazione). In produzione vanno
+# sovrascritte tramite --connection (es. "mongodb://host/?w=majority&journal=true").
+_CLIENT_DEFAULTS = {
+    "w": 1,
+    "journal": False,
+    "maxPoolSize": 4,
+    "retryWrites": False,
+    "serverSelectionTimeoutMS": 2000,
+    "compressors": ",".join(_COMPRESSORS),
+    "zlibCompressionLevel": 6
+}
+
+# Codici di errore server: Unauthorized, AuthenticationFailed, NamespaceExists
+_AUTH_ERROR_CODES = (13, 18)
+_NAMESPACE_EXISTS = 48
+
+# Indici per collezione: (chiavi, opzioni). I non univoci sono costruiti in
+# background, gli univoci dopo il caricamento dati (vedi create_indexes)
+_BACKGROUND = {"background": True}
+_UNIQUE = {"unique": True}
+_INDEX_SPECS = {
+    "autori": [
+        ([("nome", ASCENDING), ("cognome", ASCENDING)], _BACKGROUND),
+        ([("cognome", ASCENDING)], _BACKGROUND)
+    ],
+    "libri": [
+        ([("autore_id", ASCENDING)], _BACKGROUND),
+        ([("isbn", ASCENDING)], _UNIQUE),
+        ([("titolo", ASCENDING)], _BACKGROUND),
+        ([("genere", ASCENDING)], _BACKGROUND)
+    ],
+    "utenti": [
+        ([("email", ASCENDING)], _UNIQUE),
+        ([("codice_fiscale", ASCENDING)], _UNIQUE),
+        ([("cognome", ASCENDING)], _BACKGROUND)
+    ],
+    "prestiti": [
+        ([("utente_id", ASCENDING)], _BACKGROUND),
+        ([("libro_id", ASCENDING)], _BACKGROUND),
+        ([("data_prestito", DESCENDING)], _BACKGROUND),
+        ([("data_scadenza", ASCENDING)], _BACKGROUND),
+        ([("stato", ASCENDING)], _BACKGROUND)
+    ]
+}
+
+# Pattern condivisi dai validatori
+_ISBN_PATTERN = "^[0-9-]{10,17}$"
+_EMAIL_PATTERN = "^[\\w\\.-]+@[\\w\\.-]+\\.[a-zA-Z]{2,}$"
+
+# Schema validazione Autori
+_AUTORI_VALIDATOR = {
+    "$jsonSchema": {
+        "bsonType": "object",
+        "required": ["nome", "cognome", "data_nascita"],
+        "properties": {
+            "nome": {"bsonType": "string", "minLength": 1},
+            "cognome": {"bsonType": "string", "minLength": 1},
+            "data_nascita": {"bsonType": "date"},
+            "data_morte": {"bsonType": ["date", "null"]},
+            "nazionalita": {"bsonType": "string"},
+            "biografia": {"bsonType": "string"}
+        }
+    }
+}
+
+# Schema validazione Libri
+_LIBRI_VALIDATOR = {
+    "$jsonSchema": {
+        "bsonType": "object",
+        "required": ["titolo", "autore_id", "isbn", "anno_pubblicazione", "copie_disponibili"],
+        "properties": {
+            "titolo": {"bsonType": "string", "minLength": 1},
+            "autore_id": {"bsonType": "objectId"},
+            "autore_nome": {"bsonType": "string"},
+            "isbn": {"bsonType": "string", "pattern": _ISBN_PATTERN},
+            "anno_pubblicazione": {"bsonType": "int", "minimum": 1000, "maximum": 2030},
+            "genere": {"bsonType": "string"},
+            "editore": {"bsonType": "string"},
+            "pagine": {"bsonType": "int", "minimum": 1},
+            "copie_totali": {"bsonType": "int", "minimum": 1},
+            "copie_disponibili": {"bsonType": "int", "minimum": 0},
+            "descrizione": {"bsonType": "string"}
+        }
+    }
+}
+
+# Schema validazione Utenti
+_UTENTI_VALIDATOR = {
+    "$jsonSchema": {
+        "bsonType": "object",
+        "required": ["nome", "cognome", "email", "codice_fiscale", "data_registrazione"],
+        "properties": {
+            "nome": {"bsonType": "string", "minLength": 1},
+            "cognome": {"bsonType": "string", "minLength": 1},
+            "email": {"bsonType": "string", "pattern": _EMAIL_PATTERN},
+            "codice_fiscale": {"bsonType": "string", "minLength": 16, "maxLength": 16},
+            "telefono": {"bsonType": "string"},
+            "data_registrazione": {"bsonType": "date"},
+            "attivo": {"bsonType": "bool"}
+        }
+    }
+}
+
+# Schema validazione Prestiti
+_PRESTITI_VALIDATOR = {
+    "$jsonSchema": {
+        "bsonType": "object",
+        "required": ["libro_id", "utente_id", "data_prestito", "data_scadenza", "utente_nome", "utente_email"],
+        "properties": {
+            "libro_id": {"bsonType": "objectId"},
+            "utente_id": {"bsonType": "objectId"},
+            "data_prestito": {"bsonType": "long"},
+            "data_scadenza": {"bsonType": "long"},
+            "data_restituzione": {"bsonType": ["long", "null"]},
+            "utente_nome": {"bsonType": "string"},
+            "utente_email": {"bsonType": "string"},
+            "note": {"bsonType": "string"},
+            "stato": {"enum": ["attivo", "restituito", "scaduto"]}
+        }
+    }
+}
+
+# Collezioni con relativo validatore, nell'ordine di creazione
+_COLLECTION_VALIDATORS = (
+    ("autori", _AUTORI_VALIDATOR),
+    ("libri", _LIBRI_VALIDATOR),
+    ("utenti", _UTENTI_VALIDATOR),
+    ("prestiti", _PRESTITI_VALIDATOR)
+)
+
+
+def _dt(dt: datetime) -> Int64:
+    """Converte un datetime in epoch-ms (Int64) per le date dei prestiti"""
+    return Int64(int(dt.timestamp() * 1000))
+
+
+# Emitter per collezione: convertono in stringa solo i campi ObjectId e data noti
+# dallo schema, così entrambi gli encoder scrivono lo stesso JSON
+def _emit_id(doc: Dict[str, Any]) -> Dict[str, Any]:
+    doc["_id"] = str(doc["_id"])
+    return doc
+
+
+def _emit_autori(doc: Dict[str, Any]) -> Dict[str, Any]:
+    _emit_id(doc)
+    doc["data_nascita"] = doc["data_nascita"].isoformat()
+    if doc.get("data_morte") is not None:
+        doc["data_morte"] = doc["data_morte"].isoformat()
+    return doc
+
+
+def _emit_libri(doc: Dict[str, Any]) -> Dict[str, Any]:
+    _emit_id(doc)
+    doc["autore_id"] = str(doc["autore_id"])
+    return doc
+
+
+def _emit_utenti(doc: Dict[str, Any]) -> Dict[str, Any]:
+    _emit_id(doc)
+    doc["data_registrazione"] = doc["data_registrazione"].isoformat()
+    return doc
+
+
+def _emit_prestiti(doc: Dict[str, Any]) -> Dict[str, Any]:
+    _emit_id(doc)
+    doc["libro_id"] = str(doc["libro_id"])
+    doc["utente_id"] = str(doc["utente_id"])
+    return doc
+
+
+_EMITTERS = {
+    "autori": _emit_autori,
+    "libri": _emit_libri,
+    "utenti": _emit_utenti,
+    "prestiti": _emit_prestiti
+}
+
+
+def _dumps_json(document: Dict[str, Any]) -> bytes:
+    """Serializza un documento in JSON (orjson se disponibile, altrimenti bson.json_util)"""
+    # ObjectId e date sono già stringhe (vedi _EMITTERS): i due encoder danno lo stesso output
+    if orjson is not None:
+        return orjson.dumps(document, option=orjson.OPT_INDENT_2, default=str)
+    return bson_dumps(
+        document,
+        json_options=RELAXED_JSON_OPTIONS,
+        indent=2,
+        ensure_ascii=False
+    ).encode('utf-8')
+
+
 class BibliotecaSetup:
     def __init__(self, connection_string: str = "mongodb://localhost:27017/"):
-        """Inizializza la connessione MongoDB"""
-        try:
-            self.client = MongoClient(connection_string)
-            # Test connessione
-            self.client.admin.command('ping')
-            self.db = self.client.biblioteca
-            print("✅ Connessione MongoDB stabilita")
-        except ConnectionFailure:
-            print("❌ Errore: Impossibile connettersi a MongoDB")
-            sys.exit(1)
+        """Inizializza il client MongoDB (la connessione è verificata alla prima operazione)"""
+        # Default per il setup locale, a meno che non siano già nella connection string.
+        # Si leggono solo le opzioni della query: nessuna risoluzione DNS per mongodb+srv://
+        _, _, query = connection_string.partition("?")
+        uri_options = uri_parser.split_options(query) if query else {}
+        client_options = {
+            key: value for key, value in _CLIENT_DEFAULTS.items()
+            if key not in uri_options
+        }
+        # pymongo avvisa per ogni compressore non installato: qui è atteso, si usa il successivo
+        with warnings.catch_warnings():
+            warnings.filterwarnings(
+                "ignore",
+                message="Wire protocol compression with",
+                category=UserWarning
+            )
+            self.client = MongoClient(connection_string, **client_options)
+        self.db = self.client.biblioteca
 
     def drop_database(self):
         """Elimina il database esistente (per reset completo)"""
         try:
             self.client.drop_database('biblioteca')
             print("🗑️  Database esistente eliminato")
+        except ConnectionFailure:
+            raise
+        except OperationFailure as e:
+            if e.code in _AUTH_ERROR_CODES:
+                raise
+            print(f"⚠️  Errore durante eliminazione database: {e}")
         except Exception as e:
             print(f"⚠️  Errore durante eliminazione database: {e}")
 
     def create_collections(self):
-        """Crea le collezioni con validation schema"""
+        """Crea le collezioni con validation schema (disattivato fino al termine del caricamento)"""
         print("\n📚 Creazione collezioni...")
         
-        # Schema validazione Autori
-        autori_validator = {
-            "$jsonSchema": {
-                "bsonType": "object",
-                "required": ["nome", "cognome", "data_nascita"],
-                "properties": {
-                    "nome": {"bsonType": "string", "minLength": 1},
-                    "cognome": {"bsonType": "string", "minLength": 1},
-                    "data_nascita": {"bsonType": "date"},
-                    "data_morte": {"bsonType": ["date", "null"]},
-                    "nazionalita": {"bsonType": "string"},
-                    "biografia": {"bsonType": "string"}
-                }
-            }
-        }
-        
-        # Schema validazione Libri
-        libri_validator = {
-            "$jsonSchema": {
-                "bsonType": "object",
-                "required": ["titolo", "autore_id", "isbn", "anno_pubblicazione", "copie_disponibili"],
-                "properties": {
-                    "titolo": {"bsonType": "string", "minLength": 1},
-                    "autore_id": {"bsonType": "objectId"},
-                    "isbn": {"bsonType": "string", "pattern": "^[0-9-]{10,17}$"},
-                    "anno_pubblicazione": {"bsonType": "int", "minimum": 1000, "maximum": 2030},
-                    "genere": {"bsonType": "string"},
-                    "editore": {"bsonType": "string"},
-                    "pagine": {"bsonType": "int", "minimum": 1},
-                    "copie_totali": {"bsonType": "int", "minimum": 1},
-                    "copie_disponibili": {"bsonType": "int", "minimum": 0},
-                    "descrizione": {"bsonType": "string"}
-                }
-            }
-        }
-        
-        # Schema validazione Utenti
-        utenti_validator = {
-            "$jsonSchema": {
-                "bsonType": "object",
-                "required": ["nome", "cognome", "email", "codice_fiscale", "data_registrazione"],
-                "properties": {
-                    "nome": {"bsonType": "string", "minLength": 1},
-                    "cognome": {"bsonType": "string", "minLength": 1},
-                    "email": {"bsonType": "string", "pattern": "^[\\w\\.-]+@[\\w\\.-]+\\.[a-zA-Z]{2,}$"},
-                    "codice_fiscale": {"bsonType": "string", "minLength": 16, "maxLength": 16},
-                    "telefono": {"bsonType": "string"},
-                    "data_registrazione": {"bsonType": "date"},
-                    "attivo": {"bsonType": "bool"}
-                }
-            }
-        }
-        
-        # Schema validazione Prestiti
-        prestiti_validator = {
-            "$jsonSchema": {
-                "bsonType": "object",
-                "required": ["libro_id", "utente_id", "data_prestito", "data_scadenza", "utente_nome", "utente_email"],
-                "properties": {
-                    "libro_id": {"bsonType": "objectId"},
-                    "utente_id": {"bsonType": "objectId"},
-                    "data_prestito": {"bsonType": "date"},
-                    "data_scadenza": {"bsonType": "date"},
-                    "data_restituzione": {"bsonType": ["date", "null"]},
-                    "utente_nome": {"bsonType": "string"},
-                    "utente_email": {"bsonType": "string"},
-                    "note": {"bsonType": "string"},
-                    "stato": {"enum": ["attivo", "restituito", "scaduto"]}
-                }
-            }
-        }
-        
         # Crea collezioni con validazione
-        collections = [
-            ("autori", autori_validator),
-            ("libri", libri_validator),
-            ("utenti", utenti_validator),
-            ("prestiti", prestiti_validator)
-        ]
-        
-        for collection_name, validator in collections:
+        for collection_name, validator in _COLLECTION_VALIDATORS:
             try:
                 self.db.create_collection(
                     collection_name,
-                    validator=validator
+                    validator=validator,
+                    validationLevel="off"
                 )
                 print(f"  ✅ Collezione '{collection_name}' creata")
+            except CollectionInvalid as e:
+                print(f"  ⚠️  Collezione '{collection_name}' già esistente: {e}")
+            except OperationFailure as e:
+                # Creata da un altro client dopo il controllo di esistenza del driver
+                if e.code != _NAMESPACE_EXISTS:
+                    raise
+                print(f"  ⚠️  Collezione '{collection_name}' già esistente: {e}")
+
+    def enable_validation(self):
+        """Riattiva la validation schema dopo il caricamento dei dati"""
+        print("\n🛡️  Attivazione validazione...")
+        
+        # Il validatore è reinviato: su un database esistente sostituisce lo schema precedente
+        for collection_name, validator in _COLLECTION_VALIDATORS:
+            try:
+                self.db.command(
+                    "collMod",
+                    collection_name,
+                    validator=validator,
+                    validationLevel="strict"
+                )
+                print(f"  ✅ Validazione '{collection_name}' attivata")
             except Exception as e:
-                print(f"  ⚠️  Collezione '{collection_name}' già esistente o errore: {e}")
+                print(f"  ⚠️  Errore attivazione validazione '{collection_name}': {e}")
 
     def create_indexes(self):
-        """Crea indici per ottimizzare le performance"""
+        """Crea indici per ottimizzare le performance (dopo il caricamento dati)"""
         print("\n🔍 Creazione indici...")
         
         try:
-            # Indici Autori
-            self.db.autori.create_index([("nome", ASCENDING), ("cognome", ASCENDING)])
-            self.db.autori.create_index([("cognome", ASCENDING)])
-            print("  ✅ Indici autori creati")
-            
-            # Indici Libri
-            self.db.libri.create_index([("autore_id", ASCENDING)])
-            self.db.libri.create_index([("isbn", ASCENDING)], unique=True)
-            self.db.libri.create_index([("titolo", ASCENDING)])
-            self.db.libri.create_index([("genere", ASCENDING)])
-            print("  ✅ Indici libri creati")
-            
-            # Indici Utenti
-            self.db.utenti.create_index([("email", ASCENDING)], unique=True)
-            self.db.utenti.create_index([("codice_fiscale", ASCENDING)], unique=True)
-            self.db.utenti.create_index([("cognome", ASCENDING)])
-            print("  ✅ Indici utenti creati")
-            
-            # Indici Prestiti
-            self.db.prestiti.create_index([("utente_id", ASCENDING)])
-            self.db.prestiti.create_index([("libro_id", ASCENDING)])
-            self.db.prestiti.create_index([("data_prestito", DESCENDING)])
-            self.db.prestiti.create_index([("data_scadenza", ASCENDING)])
-            self.db.prestiti.create_index([("stato", ASCENDING)])
-            print("  ✅ Indici prestiti creati")
+            for collection_name, specs in _INDEX_SPECS.items():
+                self.db[collection_name].create_indexes(
+                    [IndexModel(keys, **options) for keys, options in specs]
+                )
+                print(f"  ✅ Indici {collection_name} creati")
             
         except Exception as e:
             print(f"  ⚠️  Errore creazione indici: {e}")
@@ -166,9 +309,10 @@ class BibliotecaSetup:
         """Carica dati di esempio"""
         print("\n📝 Caricamento dati di esempio...")
         
-        # Dati Autori
+        # Dati Autori (_id assegnati lato client: referenziati dalle collezioni successive)
         autori_data = [
             {
+                "_id": ObjectId(),
                 "nome": "Alessandro",
                 "cognome": "Manzoni",
                 "data_nascita": datetime(1785, 3, 7),
@@ -177,6 +321,7 @@ class BibliotecaSetup:
                 "biografia": "Scrittore e poeta italiano del romanticismo"
             },
             {
+                "_id": ObjectId(),
                 "nome": "Italo",
                 "cognome": "Calvino",
                 "data_nascita": datetime(1923, 10, 15),
@@ -185,6 +330,7 @@ class BibliotecaSetup:
                 "biografia": "Scrittore e giornalista italiano"
             },
             {
+                "_id": ObjectId(),
                 "nome": "Umberto",
                 "cognome": "Eco",
                 "data_nascita": datetime(1932, 1, 5),
@@ -195,9 +341,12 @@ class BibliotecaSetup:
         ]
         
         try:
-            result = self.db.autori.insert_many(autori_data)
-            autori_ids = result.inserted_ids
-            print(f"  ✅ {len(autori_ids)} autori inseriti")
+            result = self.db.autori.bulk_write(
+                [InsertOne(doc) for doc in autori_data],
+                ordered=False,
+                bypass_document_validation=True
+            )
+            print(f"  ✅ {result.inserted_count} autori inseriti")
         except Exception as e:
             print(f"   Errore inserimento autori: {e}")
             return
@@ -205,8 +354,9 @@ class BibliotecaSetup:
         # Dati Libri
         libri_data = [
             {
+                "_id": ObjectId(),
                 "titolo": "I Promessi Sposi",
-                "autore_id": autori_ids[0],
+                "autore_id": autori_data[0]["_id"],
                 "isbn": "978-88-17-12345-1",
                 "anno_pubblicazione": 1827,
                 "genere": "Romanzo storico",
@@ -217,8 +367,9 @@ class BibliotecaSetup:
                 "descrizione": "Capolavoro della letteratura italiana"
             },
             {
+                "_id": ObjectId(),
                 "titolo": "Il Barone Rampante",
-                "autore_id": autori_ids[1],
+                "autore_id": autori_data[1]["_id"],
                 "isbn": "978-88-06-12345-2",
                 "anno_pubblicazione": 1957,
                 "genere": "Narrativa",
@@ -229,8 +380,9 @@ class BibliotecaSetup:
                 "descrizione": "Secondo romanzo della trilogia I nostri antenati"
             },
             {
+                "_id": ObjectId(),
                 "titolo": "Il Nome della Rosa",
-                "autore_id": autori_ids[2],
+                "autore_id": autori_data[2]["_id"],
                 "isbn": "978-88-45-12345-3",
                 "anno_pubblicazione": 1980,
                 "genere": "Giallo storico",
@@ -242,10 +394,19 @@ class BibliotecaSetup:
             }
         ]
         
+        # Nome autore denormalizzato nei libri: evita il $lookup nelle letture
+        autori_by_id = {autore["_id"]: autore for autore in autori_data}
+        for doc in libri_data:
+            autore = autori_by_id[doc["autore_id"]]
+            doc["autore_nome"] = f"{autore['nome']} {autore['cognome']}"
+        
         try:
-            result = self.db.libri.insert_many(libri_data)
-            libri_ids = result.inserted_ids
-            print(f"   {len(libri_ids)} libri inseriti")
+            result = self.db.libri.bulk_write(
+                [InsertOne(doc) for doc in libri_data],
+                ordered=False,
+                bypass_document_validation=True
+            )
+            print(f"   {result.inserted_count} libri inseriti")
         except Exception as e:
             print(f"   Errore inserimento libri: {e}")
             return
@@ -253,6 +414,7 @@ class BibliotecaSetup:
         # Dati Utenti
         utenti_data = [
             {
+                "_id": ObjectId(),
                 "nome": "Mario",
                 "cognome": "Rossi",
                 "email": "mario.rossi@email.com",
@@ -262,6 +424,7 @@ class BibliotecaSetup:
                 "attivo": True
             },
             {
+                "_id": ObjectId(),
                 "nome": "Giulia",
                 "cognome": "Bianchi",
                 "email": "giulia.bianchi@email.com",
@@ -271,6 +434,7 @@ class BibliotecaSetup:
                 "attivo": True
             },
             {
+                "_id": ObjectId(),
                 "nome": "Luca",
                 "cognome": "Verdi",
                 "email": "luca.verdi@email.com",
@@ -282,9 +446,12 @@ class BibliotecaSetup:
         ]
         
         try:
-            result = self.db.utenti.insert_many(utenti_data)
-            utenti_ids = result.inserted_ids
-            print(f"   {len(utenti_ids)} utenti inseriti")
+            result = self.db.utenti.bulk_write(
+                [InsertOne(doc) for doc in utenti_data],
+                ordered=False,
+                bypass_document_validation=True
+            )
+            print(f"   {result.inserted_count} utenti inseriti")
         except Exception as e:
             print(f"   Errore inserimento utenti: {e}")
             return
@@ -293,21 +460,21 @@ class BibliotecaSetup:
         base_date = datetime.now() - timedelta(days=30)
         prestiti_data = [
             {
-                "libro_id": libri_ids[0],
-                "utente_id": utenti_ids[0],
-                "data_prestito": base_date,
-                "data_scadenza": base_date + timedelta(days=30),
-                "data_restituzione": base_date + timedelta(days=25),
+                "libro_id": libri_data[0]["_id"],
+                "utente_id": utenti_data[0]["_id"],
+                "data_prestito": _dt(base_date),
+                "data_scadenza": _dt(base_date + timedelta(days=30)),
+                "data_restituzione": _dt(base_date + timedelta(days=25)),
                 "utente_nome": "Mario Rossi",
                 "utente_email": "mario.rossi@email.com",
                 "stato": "restituito",
                 "note": "Restituito in perfette condizioni"
             },
             {
-                "libro_id": libri_ids[2],
-                "utente_id": utenti_ids[1],
-                "data_prestito": datetime.now() - timedelta(days=10),
-                "data_scadenza": datetime.now() + timedelta(days=20),
+                "libro_id": libri_data[2]["_id"],
+                "utente_id": utenti_data[1]["_id"],
+                "data_prestito": _dt(datetime.now() - timedelta(days=10)),
+                "data_scadenza": _dt(datetime.now() + timedelta(days=20)),
                 "data_restituzione": None,
                 "utente_nome": "Giulia Bianchi",
                 "utente_email": "giulia.bianchi@email.com",
@@ -317,8 +484,12 @@ class BibliotecaSetup:
         ]
         
         try:
-            result = self.db.prestiti.insert_many(prestiti_data)
-            print(f"   {len(result.inserted_ids)} prestiti inseriti")
+            result = self.db.prestiti.bulk_write(
+                [InsertOne(doc) for doc in prestiti_data],
+                ordered=False,
+                bypass_document_validation=True
+            )
+            print(f"   {result.inserted_count} prestiti inseriti")
         except Exception as e:
             print(f"   Errore inserimento prestiti: {e}")
 
@@ -328,10 +499,10 @@ class BibliotecaSetup:
         
         # Conta documenti per collezione
         counts = {
-            "autori": self.db.autori.count_documents({}),
-            "libri": self.db.libri.count_documents({}),
-            "utenti": self.db.utenti.count_documents({}),
-            "prestiti": self.db.prestiti.count_documents({})
+            "autori": self.db.autori.estimated_document_count(),
+            "libri": self.db.libri.estimated_document_count(),
+            "utenti": self.db.utenti.estimated_document_count(),
+            "prestiti": self.db.prestiti.estimated_document_count()
         }
         
         print(" Documenti per collezione:")
@@ -341,24 +512,9 @@ class BibliotecaSetup:
         # Test query di esempio
         print("\n Test query:")
         
-        # Query con join per libri e autori
+        # Query libri con autore (nome denormalizzato, nessun join)
         pipeline = [
-            {
-                "$lookup": {
-                    "from": "autori",
-                    "localField": "autore_id",
-                    "foreignField": "_id",
-                    "as": "autore"
-                }
-            },
-            {"$unwind": "$autore"},
-            {
-                "$project": {
-                    "titolo": 1,
-                    "autore_nome": {"$concat": ["$autore.nome", " ", "$autore.cognome"]},
-                    "copie_disponibili": 1
-                }
-            }
+            {"$project": {"titolo": 1, "autore_nome": 1, "copie_disponibili": 1}}
         ]
         
         try:
@@ -373,6 +529,34 @@ class BibliotecaSetup:
         except Exception as e:
             print(f"   Errore test query: {e}")
 
+    def _export_one(self, collection_name: str) -> str:
+        """Esporta una singola collezione e restituisce il messaggio di esito"""
+        filename = f"data/{collection_name}_sample.json"
+        # Scrittura su file temporaneo: un errore a metà stream non lascia JSON troncato
+        tmp_filename = filename + ".tmp"
+        try:
+            # Cursore a batch grandi: meno getMore, nessuna lista in memoria
+            cursor = self.db[collection_name].find({}, batch_size=1000)
+            
+            # Salva in file JSON, un documento alla volta
+            count = 0
+            with open(tmp_filename, 'wb') as f:
+                f.write(b"[")
+                for doc in map(_EMITTERS[collection_name], cursor):
+                    f.write(b",\n  " if count else b"\n  ")
+                    # Indenta il documento dentro l'array (i newline nelle stringhe sono escaped)
+                    f.write(_dumps_json(doc).replace(b"\n", b"\n  "))
+                    count += 1
+                f.write(b"\n]" if count else b"]")
+            os.replace(tmp_filename, filename)
+            
+            return f"  ✅ {filename} creato ({count} documenti)"
+            
+        except Exception as e:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            return f"  ❌ Errore esportazione {collection_name}: {e}"
+
     def export_sample_json(self):
         """Esporta esempi in formato JSON"""
         print("\nEsportazione esempi JSON...")
@@ -382,43 +566,35 @@ class BibliotecaSetup:
         
         collections = ["autori", "libri", "utenti", "prestiti"]
         
-        for collection_name in collections:
-            try:
-                # Recupera documenti
-                documents = list(self.db[collection_name].find())
-                
-                # Converte ObjectId in stringhe per JSON
-                for doc in documents:
-                    if "_id" in doc:
-                        doc["_id"] = str(doc["_id"])
-                    # Converte altri ObjectId
-                    for key, value in doc.items():
-                        if isinstance(value, ObjectId):
-                            doc[key] = str(value)
-                        elif isinstance(value, datetime):
-                            doc[key] = value.isoformat()
-                
-                # Salva in file JSON
-                filename = f"data/{collection_name}_sample.json"
-                with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(documents, f, indent=2, ensure_ascii=False, default=str)
-                
-                print(f"  ✅ {filename} creato ({len(documents)} documenti)")
-                
-            except Exception as e:
-                print(f"  ❌ Errore esportazione {collection_name}: {e}")
+        # Export in parallelo: letture e scritture su file si sovrappongono
+        with ThreadPoolExecutor(len(collections)) as executor:
+            for message in executor.map(self._export_one, collections):
+                print(message)
 
     def run_complete_setup(self, reset: bool = False):
         """Esegue il setup completo"""
         print("🚀 Avvio setup Sistema Biblioteca MongoDB")
         print("=" * 50)
         
-        if reset:
-            self.drop_database()
+        try:
+            if reset:
+                self.drop_database()
+            
+            # Prima operazione sul server: verifica anche connessione e credenziali
+            self.create_collections()
+            print("✅ Connessione MongoDB stabilita")
+        except ConnectionFailure:
+            print("❌ Errore: Impossibile connettersi a MongoDB")
+            sys.exit(1)
+        except OperationFailure as e:
+            if e.code not in _AUTH_ERROR_CODES:
+                raise
+            print(f"❌ Errore: Autenticazione MongoDB fallita: {e}")
+            sys.exit(1)
         
-        self.create_collections()
-        self.create_indexes()
         self.load_sample_data()
+        self.enable_validation()
+        self.create_indexes()
         self.validate_setup()
         self.export_sample_json()
         